@@ -2,29 +2,26 @@
 FastAPI Application with OpenTelemetry Metrics Export
 
 This application demonstrates comprehensive OTel instrumentation with:
-- Automatic HTTP request/response metrics
+- Per-request count/duration/in-flight metrics from a single ASGI middleware
 - Custom business metrics
 - OTLP export to collector on localhost:4318
 """
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import Optional
-import uvicorn
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import orjson
+import redis.asyncio as redis
+import asyncio
 import time
 import random
 import os
 
-# OpenTelemetry imports
-from opentelemetry import metrics
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.metrics import get_meter_provider, set_meter_provider
-
 # Configuration - Read from environment
 SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "fastapi-otel-demo")
 # CRITICAL: For HTTP, use the full path. For gRPC, use just host:port
@@ -35,62 +32,89 @@ OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"
 if OTLP_ENDPOINT and not OTLP_ENDPOINT.endswith('/v1/metrics'):
     OTLP_ENDPOINT = f"{OTLP_ENDPOINT}/v1/metrics"
 
+# Interactive docs and the OpenAPI schema are opt-in: only served when
+# ENVIRONMENT is explicitly set to development, never by default
+ENVIRONMENT = os.getenv("ENVIRONMENT")
+DOCS_URL = "/docs" if ENVIRONMENT == "development" else None
+
+# Item storage shared by every uvicorn worker
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Skip the OTel SDK entirely (unit tests, CLI) - same switch the SDK itself honours
+OTEL_SDK_DISABLED = os.getenv("OTEL_SDK_DISABLED", "").lower() in {"1", "true"}
+
+
+class NoOpInstrument:
+    """Stand-in for the custom instruments when the SDK is disabled"""
+
+    def add(self, amount, attributes=None):
+        pass
+
+    def record(self, amount, attributes=None):
+        pass
+
+
+meter_provider = None
 
-# Initialize OpenTelemetry
-def init_telemetry():
-    """Initialize OpenTelemetry with OTLP exporter"""
-    resource = Resource.create({
-        "service.name": SERVICE_NAME,
-        "service.version": "1.0.0",
-        "deployment.environment": os.getenv("ENVIRONMENT", "development")
-    })
+if OTEL_SDK_DISABLED:
+    request_counter = processing_time = active_connections = simulated_delay = NoOpInstrument()
+else:
+    from opentelemetry import metrics
 
-    # Configure OTLP HTTP exporter with full endpoint
-    exporter = OTLPMetricExporter(
-        endpoint=OTLP_ENDPOINT,
-        timeout=10
+    # Instruments are created against the global proxy meter and bind to the real
+    # MeterProvider once init_telemetry() runs in each worker's startup hook
+    meter = metrics.get_meter(__name__)
+
+    # Custom metrics
+    request_counter = meter.create_counter(
+        name="custom.requests.total",
+        description="Total number of requests by endpoint",
+        unit="1"
     )
 
-    # Create metric reader with 10s export interval
-    reader = PeriodicExportingMetricReader(exporter, export_interval_millis=10000)
+    processing_time = meter.create_histogram(
+        name="custom.processing.duration",
+        description="Request processing duration by endpoint",
+        unit="ms"
+    )
 
-    # Set up MeterProvider
-    provider = MeterProvider(resource=resource, metric_readers=[reader])
-    set_meter_provider(provider)
+    active_connections = meter.create_up_down_counter(
+        name="custom.active.connections",
+        description="Number of active connections",
+        unit="1"
+    )
 
-    return provider
+    simulated_delay = meter.create_histogram(
+        name="custom.simulated.delay",
+        description="Simulated latency from /simulate/slow",
+        unit="ms"
+    )
 
 
-# Initialize telemetry
-meter_provider = init_telemetry()
-meter = metrics.get_meter(__name__)
+# Metric attributes, built once so the SDK's attribute-set lookup hits the
+# same objects on every request instead of hashing fresh dicts
+@lru_cache(maxsize=256)
+def request_attrs(endpoint: str, method: str, status: int) -> dict:
+    """Counter/histogram attributes, one shared dict per (endpoint, method, status)"""
+    return {"endpoint": endpoint, "method": method, "status": str(status)}
 
-# Custom metrics
-request_counter = meter.create_counter(
-    name="custom.requests.total",
-    description="Total number of requests by endpoint",
-    unit="1"
-)
 
-processing_time = meter.create_histogram(
-    name="custom.processing.duration",
-    description="Processing duration for business logic",
-    unit="ms"
-)
+# Connection-tracking attributes per route template, filled from app.routes in
+# the lifespan hook; the +1 and -1 share one object so both hit the same aggregator entry
+UNMATCHED_ROUTE = "unmatched"
+UNMATCHED_ATTRS = {"endpoint": UNMATCHED_ROUTE}
+ROUTE_ATTRS: dict[str, dict] = {}
 
-active_connections = meter.create_up_down_counter(
-    name="custom.active.connections",
-    description="Number of active connections",
-    unit="1"
-)
+# Load balancer / kubelet probes would dominate request counts, so they go unmetered
+UNMETERED_PATHS = {"/health"}
 
 
 # Pydantic models
 class Item(BaseModel):
     name: str
-    description: Optional[str] = None
+    description: str | None = None
     price: float
-    tax: Optional[float] = None
+    tax: float | None = None
 
 
 class HealthResponse(BaseModel):
@@ -99,38 +123,141 @@ class HealthResponse(BaseModel):
     timestamp: float
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker startup and shutdown
+
+    Runs in each uvicorn worker after fork, so every worker initializes its own
+    MeterProvider; one created in the parent would be orphaned along with its
+    export thread.
+    """
+    global meter_provider
+    if not OTEL_SDK_DISABLED:
+        from telemetry import init_telemetry
+        meter_provider = init_telemetry(SERVICE_NAME, OTLP_ENDPOINT)
+    ROUTE_ATTRS.update({route.path: {"endpoint": route.path} for route in app.routes})
+
+    try:
+        yield
+    finally:
+        if meter_provider is not None:
+            meter_provider.shutdown()
+        if get_redis.cache_info().currsize:
+            await get_redis().aclose()
+
+
 # Initialize FastAPI
 app = FastAPI(
     title="OTel Instrumented API",
     description="FastAPI with OpenTelemetry metrics collection",
-    version="1.0.0"
+    version="1.0.0",
+    docs_url=DOCS_URL,
+    redoc_url=None,
+    openapi_url=DOCS_URL and "/openapi.json",
+    lifespan=lifespan
 )
 
-# Instrument FastAPI - ONLY for metrics, disable traces
-# We're not setting up trace exporters, so disable automatic trace instrumentation
-FastAPIInstrumentor.instrument_app(app)
+# Compress larger payloads such as the /items listing
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 
-# Middleware for connection tracking
-@app.middleware("http")
-async def track_connections(request: Request, call_next):
-    active_connections.add(1, {"endpoint": request.url.path})
-    try:
-        response = await call_next(request)
-        return response
-    finally:
-        active_connections.add(-1, {"endpoint": request.url.path})
+# Metrics middleware - one pure ASGI pass per request replaces the
+# FastAPIInstrumentor, the connection-tracking middleware and per-handler calls
+def match_route_path(scope: Scope) -> str:
+    """Route template for a request, e.g. /items/{item_id} rather than /items/42
+
+    Resolved before dispatch so the in-flight gauge can use it too. Paths that
+    match no route share one bucket to keep attribute cardinality bounded.
+    """
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match is not Match.NONE:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Record request count, duration and in-flight requests for HTTP scopes"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in UNMETERED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        route_path = match_route_path(scope)
+        connection_attrs = ROUTE_ATTRS.get(route_path, UNMATCHED_ATTRS)
+        active_connections.add(1, connection_attrs)
+        start = time.perf_counter()
+        finished = False
+        # Stays 500 if the app raises before starting a response
+        status_code = 500
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            duration = (time.perf_counter() - start) * 1000.0
+            attrs = request_attrs(route_path, scope["method"], status_code)
+            request_counter.add(1, attrs)
+            processing_time.record(duration, attrs)
+            active_connections.add(-1, connection_attrs)
+
+        # Close out on the last body chunk - background tasks run inside the app
+        # call after that and must not count towards the request
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
 
 
-# In-memory storage for demo
-items_db = {}
+app.add_middleware(MetricsMiddleware)
+
+
+# Redis storage - items live in hashes at item:{id}, ids are allocated with
+# INCR and indexed in a set so listing doesn't need a keyspace SCAN. The
+# bookkeeping keys sit under items: so no item_id can address them
+ITEM_SEQ_KEY = "items:seq"
+ITEM_INDEX_KEY = "items:index"
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> redis.Redis:
+    """Shared async Redis client, created lazily so each worker owns its pool"""
+    return redis.from_url(REDIS_URL, decode_responses=True, max_connections=50)
+
+
+async def redis_client() -> redis.Redis:
+    """Async dependency wrapper - sync dependencies are dispatched to the threadpool"""
+    return get_redis()
+
+
+def item_key(item_id: str) -> str:
+    return f"item:{item_id}"
+
+
+def load_item(item_id: str, data: dict) -> dict:
+    """Rebuild an item from its hash; Redis stores every field as a string"""
+    item_dict = Item(**data).model_dump()
+    item_dict["id"] = item_id
+    return item_dict
 
 
 # Endpoints
 @app.get("/", response_model=dict)
 async def root():
     """Root endpoint with API information"""
-    request_counter.add(1, {"endpoint": "/", "method": "GET"})
     return {
         "service": SERVICE_NAME,
         "version": "1.0.0",
@@ -149,121 +276,127 @@ async def root():
     }
 
 
+# Probes hit /health at high QPS - serve a prebuilt body and only patch in the timestamp
+HEALTH_BODY_PREFIX = b'{"status":"healthy","service":' + orjson.dumps(SERVICE_NAME) + b',"timestamp":'
+HEALTH_BODY_SUFFIX = b"}"
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health():
     """Health check endpoint"""
-    request_counter.add(1, {"endpoint": "/health", "method": "GET"})
-    return HealthResponse(
-        status="healthy",
-        service=SERVICE_NAME,
-        timestamp=time.time()
+    return Response(
+        HEALTH_BODY_PREFIX + repr(time.time()).encode() + HEALTH_BODY_SUFFIX,
+        media_type="application/json"
     )
 
 
 @app.get("/items", response_model=dict)
-async def list_items():
+async def list_items(r: redis.Redis = Depends(redis_client)):
     """List all items"""
-    start = time.time()
-    request_counter.add(1, {"endpoint": "/items", "method": "GET"})
-
     # Simulate processing
-    time.sleep(random.uniform(0.01, 0.05))
+    await asyncio.sleep(random.uniform(0.01, 0.05))
 
-    duration = (time.time() - start) * 1000
-    processing_time.record(duration, {"endpoint": "/items", "method": "GET"})
+    item_ids = sorted(await r.smembers(ITEM_INDEX_KEY), key=int)
+    async with r.pipeline(transaction=False) as pipe:
+        for item_id in item_ids:
+            pipe.hgetall(item_key(item_id))
+        results = await pipe.execute()
+    items = [load_item(item_id, data) for item_id, data in zip(item_ids, results) if data]
 
-    return {"items": list(items_db.values()), "count": len(items_db)}
+    return {"items": items, "count": len(items)}
 
 
-@app.post("/items", response_model=Item, status_code=201)
-async def create_item(item: Item):
+@app.post("/items", response_model=dict, status_code=201)
+async def create_item(item: Item, r: redis.Redis = Depends(redis_client)):
     """Create a new item"""
-    start = time.time()
-    request_counter.add(1, {"endpoint": "/items", "method": "POST"})
-
-    item_id = str(len(items_db) + 1)
-    item_dict = item.dict()
+    # INCR is atomic across coroutines and workers; the hash and index entry
+    # are then written in one MULTI so a listing never sees a half-created item
+    item_id = str(await r.incr(ITEM_SEQ_KEY))
+    item_dict = item.model_dump()
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(item_key(item_id), mapping=item.model_dump(exclude_none=True))
+        pipe.sadd(ITEM_INDEX_KEY, item_id)
+        await pipe.execute()
     item_dict["id"] = item_id
-    items_db[item_id] = item_dict
-
-    duration = (time.time() - start) * 1000
-    processing_time.record(duration, {"endpoint": "/items", "method": "POST"})
 
     return item_dict
 
 
 @app.get("/items/{item_id}", response_model=dict)
-async def get_item(item_id: str):
+async def get_item(item_id: str, r: redis.Redis = Depends(redis_client)):
     """Get a specific item by ID"""
-    start = time.time()
-    request_counter.add(1, {"endpoint": "/items/{item_id}", "method": "GET"})
-
-    if item_id not in items_db:
+    data = await r.hgetall(item_key(item_id))
+    if not data:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    duration = (time.time() - start) * 1000
-    processing_time.record(duration, {"endpoint": "/items/{item_id}", "method": "GET"})
-
-    return items_db[item_id]
+    return load_item(item_id, data)
 
 
 @app.put("/items/{item_id}", response_model=dict)
-async def update_item(item_id: str, item: Item):
+async def update_item(item_id: str, item: Item, r: redis.Redis = Depends(redis_client)):
     """Update an existing item"""
-    start = time.time()
-    request_counter.add(1, {"endpoint": "/items/{item_id}", "method": "PUT"})
-
-    if item_id not in items_db:
-        raise HTTPException(status_code=404, detail="Item not found")
-
-    item_dict = item.dict()
+    key = item_key(item_id)
+
+    # WATCH the key so a DELETE between the existence check and the write
+    # aborts the MULTI and retries (then 404s) instead of resurrecting an
+    # unindexed item. The whole hash is replaced so fields cleared to None
+    # don't linger
+    async def replace_item(pipe):
+        if not await pipe.exists(key):
+            raise HTTPException(status_code=404, detail="Item not found")
+        pipe.multi()
+        pipe.delete(key)
+        pipe.hset(key, mapping=item.model_dump(exclude_none=True))
+
+    await r.transaction(replace_item, key)
+
+    item_dict = item.model_dump()
     item_dict["id"] = item_id
-    items_db[item_id] = item_dict
-
-    duration = (time.time() - start) * 1000
-    processing_time.record(duration, {"endpoint": "/items/{item_id}", "method": "PUT"})
 
     return item_dict
 
 
 @app.delete("/items/{item_id}", status_code=204)
-async def delete_item(item_id: str):
+async def delete_item(item_id: str, r: redis.Redis = Depends(redis_client)):
     """Delete an item"""
-    start = time.time()
-    request_counter.add(1, {"endpoint": "/items/{item_id}", "method": "DELETE"})
+    # Hash and index entry go together so the index never points at a missing hash
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.delete(item_key(item_id))
+        pipe.srem(ITEM_INDEX_KEY, item_id)
+        deleted, _ = await pipe.execute()
 
-    if item_id not in items_db:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    del items_db[item_id]
+    return None
 
-    duration = (time.time() - start) * 1000
-    processing_time.record(duration, {"endpoint": "/items/{item_id}", "method": "DELETE"})
 
-    return None
+# Simulated latency goes on its own histogram so it doesn't mix with real request durations
+SIMULATED_SLOW_ATTRS = {"endpoint": "/simulate/slow"}
 
 
-@app.get("/simulate/slow")
-async def simulate_slow():
-    """Simulate a slow endpoint for testing latency metrics"""
-    start = time.time()
-    request_counter.add(1, {"endpoint": "/simulate/slow", "method": "GET"})
+async def record_slow(delay: float) -> None:
+    """Background half of /simulate/slow - runs after the response has been sent"""
+    await asyncio.sleep(delay)
+    simulated_delay.record(delay * 1000.0, SIMULATED_SLOW_ATTRS)
 
-    # Random delay between 1-3 seconds
-    delay = random.uniform(1, 3)
-    time.sleep(delay)
 
-    duration = (time.time() - start) * 1000
-    processing_time.record(duration, {"endpoint": "/simulate/slow", "method": "GET"})
+@app.get("/simulate/slow", include_in_schema=False)
+async def simulate_slow(background_tasks: BackgroundTasks):
+    """Simulate a slow endpoint for testing latency metrics"""
+    # Random delay between 1-3 seconds, run after the response is sent so the
+    # client gets its answer immediately. Starlette runs background tasks inside
+    # the ASGI app call, so the request still counts against uvicorn's
+    # limit_concurrency until the delay finishes
+    delay = random.uniform(1, 3)
+    background_tasks.add_task(record_slow, delay)
 
-    return {"message": "Slow response", "delay_seconds": delay}
+    return {"message": "Slow work queued", "queued": True, "delay_seconds": delay}
 
 
-@app.get("/simulate/error")
+@app.get("/simulate/error", include_in_schema=False)
 async def simulate_error():
     """Simulate errors for testing error rate metrics"""
-    request_counter.add(1, {"endpoint": "/simulate/error", "method": "GET"})
-
     # 50% chance of error
     if random.random() < 0.5:
         raise HTTPException(status_code=500, detail="Simulated internal server error")
@@ -272,9 +405,23 @@ async def simulate_error():
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     print(f"🚀 Starting {SERVICE_NAME}")
     print(f"📊 Exporting metrics to: {OTLP_ENDPOINT}")
     print(f"🌐 API available at: http://localhost:8000")
-    print(f"📖 API docs at: http://localhost:8000/docs")
-
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if DOCS_URL:
+        print(f"📖 API docs at: http://localhost:8000{DOCS_URL}")
+
+    # Import string (not the app object) is required for workers > 1
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2)),
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
+        access_log=False
+    )
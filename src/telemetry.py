@@ -0,0 +1,135 @@
+"""
+OpenTelemetry SDK setup for the FastAPI app
+
+Kept out of main.py so the SDK and exporter are only imported when
+telemetry is enabled; see OTEL_SDK_DISABLED there.
+"""
+
+from dataclasses import replace
+import logging
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import MetricsData, PeriodicExportingMetricReader
+from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.metrics import set_meter_provider
+
+_logger = logging.getLogger(__name__)
+
+# Export cadence - longer intervals trade metric freshness for less export CPU/bandwidth
+EXPORT_INTERVAL_MILLIS = int(os.getenv("OTEL_METRIC_EXPORT_INTERVAL", "60000"))
+EXPORT_TIMEOUT_MILLIS = int(os.getenv("OTEL_METRIC_EXPORT_TIMEOUT", "30000"))
+
+# Upper bound on data points per OTLP request, keeps payloads bounded under high cardinality
+EXPORT_MAX_BATCH_SIZE = int(os.getenv("OTEL_METRIC_EXPORT_MAX_BATCH_SIZE", "512"))
+if EXPORT_MAX_BATCH_SIZE < 1:
+    raise ValueError(f"OTEL_METRIC_EXPORT_MAX_BATCH_SIZE must be at least 1, got {EXPORT_MAX_BATCH_SIZE}")
+
+
+def split_metrics_data(metrics_data: MetricsData, max_batch_size: int):
+    """Yield MetricsData chunks holding at most max_batch_size data points each"""
+    if max_batch_size < 1:
+        raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+
+    batch_size = 0
+    resource_metrics_batch = []
+    for resource_metrics in metrics_data.resource_metrics:
+        scope_metrics_batch = []
+        for scope_metrics in resource_metrics.scope_metrics:
+            metrics_batch = []
+            for metric in scope_metrics.metrics:
+                data_points = list(metric.data.data_points)
+                while data_points:
+                    room = max_batch_size - batch_size
+                    chunk, data_points = data_points[:room], data_points[room:]
+                    metrics_batch.append(replace(metric, data=replace(metric.data, data_points=chunk)))
+                    batch_size += len(chunk)
+
+                    if batch_size >= max_batch_size:
+                        scope_metrics_batch.append(replace(scope_metrics, metrics=metrics_batch))
+                        resource_metrics_batch.append(replace(resource_metrics, scope_metrics=scope_metrics_batch))
+                        yield MetricsData(resource_metrics=resource_metrics_batch)
+                        batch_size = 0
+                        resource_metrics_batch, scope_metrics_batch, metrics_batch = [], [], []
+
+            if metrics_batch:
+                scope_metrics_batch.append(replace(scope_metrics, metrics=metrics_batch))
+        if scope_metrics_batch:
+            resource_metrics_batch.append(replace(resource_metrics, scope_metrics=scope_metrics_batch))
+
+    if resource_metrics_batch:
+        yield MetricsData(resource_metrics=resource_metrics_batch)
+
+
+class BatchingMetricReader(PeriodicExportingMetricReader):
+    """Periodic reader that exports in bounded batches, each with its own timeout
+
+    Mirrors the collector's batchprocessor split - one oversized POST that
+    blows the timeout would otherwise drop the whole collection interval.
+    """
+
+    def __init__(self, exporter, max_export_batch_size: int = EXPORT_MAX_BATCH_SIZE, **kwargs):
+        # Checked up front - a bad size would otherwise only surface on the export thread
+        if max_export_batch_size < 1:
+            raise ValueError(f"max_export_batch_size must be at least 1, got {max_export_batch_size}")
+        super().__init__(exporter, **kwargs)
+        self._max_export_batch_size = max_export_batch_size
+
+    def _receive_metrics(self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs) -> None:
+        # Export errors are already logged per batch by the base class; this catches
+        # split errors the same way so they don't escape onto the export thread
+        try:
+            for batch in split_metrics_data(metrics_data, self._max_export_batch_size):
+                super()._receive_metrics(batch, timeout_millis=timeout_millis, **kwargs)
+        except Exception:
+            _logger.exception("Exception while exporting metrics")
+
+
+def otlp_session(endpoint: str) -> requests.Session:
+    """Keep-alive session for the exporter, reusing warm connections to the collector"""
+    session = requests.Session()
+    session.mount(endpoint, HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=4,
+        max_retries=Retry(total=2, backoff_factor=0.2)
+    ))
+    return session
+
+
+# Initialize OpenTelemetry
+def init_telemetry(service_name: str, endpoint: str) -> MeterProvider:
+    """Initialize OpenTelemetry with OTLP exporter"""
+    attributes = {
+        "service.name": service_name,
+        "service.version": "1.0.0"
+    }
+    # Unset means unknown, as in main.py - left out so OTEL_RESOURCE_ATTRIBUTES can still supply it
+    environment = os.getenv("ENVIRONMENT")
+    if environment:
+        attributes["deployment.environment"] = environment
+    resource = Resource.create(attributes)
+
+    # Configure OTLP HTTP exporter with full endpoint
+    exporter = OTLPMetricExporter(
+        endpoint=endpoint,
+        timeout=EXPORT_TIMEOUT_MILLIS / 1000,
+        session=otlp_session(endpoint)
+    )
+
+    # Create metric reader on the configured interval, exporting in bounded batches
+    reader = BatchingMetricReader(
+        exporter,
+        export_interval_millis=EXPORT_INTERVAL_MILLIS,
+        export_timeout_millis=EXPORT_TIMEOUT_MILLIS
+    )
+
+    # Set up MeterProvider
+    provider = MeterProvider(resource=resource, metric_readers=[reader])
+    set_meter_provider(provider)
+
+    return provider
@@ -0,0 +1,39 @@
+"""
+Shared fixtures for the app tests
+"""
+
+import os
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+# main.py reads this at import to skip telemetry setup; unset it again so the
+# SDK itself stays enabled for the telemetry tests
+os.environ["OTEL_SDK_DISABLED"] = "true"
+try:
+    import main
+finally:
+    del os.environ["OTEL_SDK_DISABLED"]
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def store(redis_server):
+    """Sync view of the fake Redis the app writes to, for asserting on keys"""
+    return fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+
+
+@pytest.fixture
+def client(redis_server):
+    fake = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+    main.app.dependency_overrides[main.redis_client] = lambda: fake
+    try:
+        with TestClient(main.app) as test_client:
+            yield test_client
+    finally:
+        main.app.dependency_overrides.clear()
@@ -0,0 +1,61 @@
+"""
+Tests for the Redis-backed item endpoints
+"""
+
+import pytest
+
+LAPTOP = {"name": "Laptop", "description": "High-performance laptop", "price": 1299.99, "tax": 129.99}
+MOUSE = {"name": "Mouse", "price": 29.99}
+
+
+def test_item_round_trip(client, store):
+    created = client.post("/items", json=LAPTOP)
+    assert created.status_code == 201
+    assert created.json() == {**LAPTOP, "id": "1"}
+    assert client.post("/items", json=MOUSE).json()["id"] == "2"
+
+    listing = client.get("/items").json()
+    assert listing["count"] == 2
+    assert [item["id"] for item in listing["items"]] == ["1", "2"]
+    assert listing["items"][1] == {**MOUSE, "description": None, "tax": None, "id": "2"}
+
+    assert client.get("/items/1").json() == {**LAPTOP, "id": "1"}
+
+    updated = client.put("/items/1", json=MOUSE)
+    assert updated.status_code == 200
+    # Fields cleared on update must not linger in the hash
+    assert client.get("/items/1").json() == {**MOUSE, "description": None, "tax": None, "id": "1"}
+    assert store.hgetall("item:1") == {"name": "Mouse", "price": "29.99"}
+
+    assert client.delete("/items/1").status_code == 204
+    assert client.get("/items/1").status_code == 404
+    assert store.smembers("items:index") == {"2"}
+    assert client.get("/items").json()["count"] == 1
+
+
+@pytest.mark.parametrize("method", ["get", "put", "delete"])
+@pytest.mark.parametrize("item_id", ["seq", "index"])
+def test_bookkeeping_keys_not_addressable(client, store, method, item_id):
+    client.post("/items", json=LAPTOP)
+    seq_before = store.get("items:seq")
+    index_before = store.smembers("items:index")
+
+    kwargs = {"json": MOUSE} if method == "put" else {}
+    response = getattr(client, method)(f"/items/{item_id}", **kwargs)
+
+    assert response.status_code == 404
+    assert store.get("items:seq") == seq_before
+    assert store.smembers("items:index") == index_before
+    assert client.post("/items", json=MOUSE).json()["id"] == "2"
+
+
+def test_put_missing_item_does_not_create_it(client, store):
+    response = client.put("/items/99", json=MOUSE)
+
+    assert response.status_code == 404
+    assert not store.exists("item:99")
+    assert store.smembers("items:index") == set()
+
+
+def test_delete_missing_item(client):
+    assert client.delete("/items/99").status_code == 404
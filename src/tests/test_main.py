@@ -4,7 +4,8 @@ Test script for FastAPI OTel endpoints
 Exercises all endpoints to generate metrics
 """
 
-import requests
+import asyncio
+import httpx
 import time
 import sys
 from typing import Dict, Any
@@ -35,7 +36,7 @@ def print_error(message: str):
     print(f"{Colors.RED}✗ {message}{Colors.END}")
 
 
-def print_response(response: requests.Response):
+def print_response(response: httpx.Response):
     print(f"Status: {response.status_code}")
     try:
         print(f"Response: {json.dumps(response.json(), indent=2)}")
@@ -43,10 +44,10 @@ def print_response(response: requests.Response):
         print(f"Response: {response.text}")
 
 
-def test_root():
+async def check_root(client: httpx.AsyncClient):
     print_test("GET / - Root endpoint")
     try:
-        response = requests.get(f"{BASE_URL}/")
+        response = await client.get("/")
         print_response(response)
         if response.status_code == 200:
             print_success("Root endpoint working")
@@ -56,10 +57,10 @@ def test_root():
         print_error(f"Error: {e}")
 
 
-def test_health():
+async def check_health(client: httpx.AsyncClient):
     print_test("GET /health - Health check")
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = await client.get("/health")
         print_response(response)
         if response.status_code == 200:
             print_success("Health check passed")
@@ -69,7 +70,7 @@ def test_health():
         print_error(f"Error: {e}")
 
 
-def test_create_items():
+async def check_create_items(client: httpx.AsyncClient):
     print_test("POST /items - Create items")
     items = [
         {"name": "Laptop", "description": "High-performance laptop", "price": 1299.99, "tax": 129.99},
@@ -77,10 +78,17 @@ def test_create_items():
         {"name": "Keyboard", "description": "Mechanical keyboard", "price": 89.99},
     ]
 
+    # Fan the creates out concurrently; gather keeps results in request order
+    responses = await asyncio.gather(
+        *[client.post("/items", json=item) for item in items],
+        return_exceptions=True
+    )
+
     created_ids = []
-    for item in items:
+    for item, response in zip(items, responses):
         try:
-            response = requests.post(f"{BASE_URL}/items", json=item)
+            if isinstance(response, Exception):
+                raise response
             print(f"\nCreating: {item['name']}")
             print_response(response)
             if response.status_code == 201:
@@ -94,10 +102,10 @@ def test_create_items():
     return created_ids
 
 
-def test_list_items():
+async def check_list_items(client: httpx.AsyncClient):
     print_test("GET /items - List all items")
     try:
-        response = requests.get(f"{BASE_URL}/items")
+        response = await client.get("/items")
         print_response(response)
         if response.status_code == 200:
             count = response.json().get("count", 0)
@@ -108,10 +116,10 @@ def test_list_items():
         print_error(f"Error: {e}")
 
 
-def test_get_item(item_id: str):
+async def check_get_item(client: httpx.AsyncClient, item_id: str):
     print_test(f"GET /items/{item_id} - Get specific item")
     try:
-        response = requests.get(f"{BASE_URL}/items/{item_id}")
+        response = await client.get(f"/items/{item_id}")
         print_response(response)
         if response.status_code == 200:
             print_success(f"Retrieved item {item_id}")
@@ -121,7 +129,7 @@ def test_get_item(item_id: str):
         print_error(f"Error: {e}")
 
 
-def test_update_item(item_id: str):
+async def check_update_item(client: httpx.AsyncClient, item_id: str):
     print_test(f"PUT /items/{item_id} - Update item")
     updated_data = {
         "name": "Updated Laptop",
@@ -130,7 +138,7 @@ def test_update_item(item_id: str):
         "tax": 149.99
     }
     try:
-        response = requests.put(f"{BASE_URL}/items/{item_id}", json=updated_data)
+        response = await client.put(f"/items/{item_id}", json=updated_data)
         print_response(response)
         if response.status_code == 200:
             print_success(f"Updated item {item_id}")
@@ -140,10 +148,10 @@ def test_update_item(item_id: str):
         print_error(f"Error: {e}")
 
 
-def test_delete_item(item_id: str):
+async def check_delete_item(client: httpx.AsyncClient, item_id: str):
     print_test(f"DELETE /items/{item_id} - Delete item")
     try:
-        response = requests.delete(f"{BASE_URL}/items/{item_id}")
+        response = await client.delete(f"/items/{item_id}")
         print(f"Status: {response.status_code}")
         if response.status_code == 204:
             print_success(f"Deleted item {item_id}")
@@ -153,13 +161,13 @@ def test_delete_item(item_id: str):
         print_error(f"Error: {e}")
 
 
-def test_slow_endpoint():
+async def check_slow_endpoint(client: httpx.AsyncClient):
     print_test("GET /simulate/slow - Test latency metrics")
     try:
-        print("Calling slow endpoint (1-3s delay expected)...")
-        start = time.time()
-        response = requests.get(f"{BASE_URL}/simulate/slow")
-        duration = time.time() - start
+        print("Calling slow endpoint (returns immediately, 1-3s delay recorded in background)...")
+        start = time.perf_counter()
+        response = await client.get("/simulate/slow")
+        duration = time.perf_counter() - start
         print_response(response)
         print(f"Duration: {duration:.2f}s")
         if response.status_code == 200:
@@ -170,34 +178,36 @@ def test_slow_endpoint():
         print_error(f"Error: {e}")
 
 
-def test_error_endpoint():
+async def check_error_endpoint(client: httpx.AsyncClient):
     print_test("GET /simulate/error - Test error rate metrics")
     successes = 0
     errors = 0
     attempts = 10
 
-    print(f"Making {attempts} requests to test error rate...")
-    for i in range(attempts):
-        try:
-            response = requests.get(f"{BASE_URL}/simulate/error")
-            if response.status_code == 200:
-                successes += 1
-                print(f"{Colors.GREEN}#{i + 1}: Success{Colors.END}")
-            else:
-                errors += 1
-                print(f"{Colors.RED}#{i + 1}: Error {response.status_code}{Colors.END}")
-        except Exception as e:
+    print(f"Making {attempts} concurrent requests to test error rate...")
+    responses = await asyncio.gather(
+        *[client.get("/simulate/error") for _ in range(attempts)],
+        return_exceptions=True
+    )
+    for i, response in enumerate(responses):
+        if isinstance(response, Exception):
             errors += 1
-            print(f"{Colors.RED}#{i + 1}: Exception: {e}{Colors.END}")
+            print(f"{Colors.RED}#{i + 1}: Exception: {response}{Colors.END}")
+        elif response.status_code == 200:
+            successes += 1
+            print(f"{Colors.GREEN}#{i + 1}: Success{Colors.END}")
+        else:
+            errors += 1
+            print(f"{Colors.RED}#{i + 1}: Error {response.status_code}{Colors.END}")
 
     print(f"\nResults: {successes} successes, {errors} errors")
     print_success(f"Error endpoint test complete - {errors / attempts * 100:.0f}% error rate")
 
 
-def test_404():
+async def check_404(client: httpx.AsyncClient):
     print_test("GET /items/999 - Test 404 handling")
     try:
-        response = requests.get(f"{BASE_URL}/items/999")
+        response = await client.get("/items/999")
         print_response(response)
         if response.status_code == 404:
             print_success("404 handling works correctly")
@@ -207,51 +217,54 @@ def test_404():
         print_error(f"Error: {e}")
 
 
-def run_all_tests():
+async def run_all_tests():
     print(f"\n{Colors.YELLOW}{'=' * 60}")
     print("FastAPI OTel Endpoint Testing Suite")
     print(f"{'=' * 60}{Colors.END}\n")
     print(f"Target: {BASE_URL}")
     print(f"This will generate various metrics for testing\n")
 
-    # Check if server is running
-    try:
-        requests.get(f"{BASE_URL}/health", timeout=2)
-    except requests.exceptions.RequestException:
-        print_error(f"Cannot connect to {BASE_URL}")
-        print("Make sure the FastAPI server is running:")
-        print("  python main.py")
-        sys.exit(1)
-
-    # Run tests
-    test_root()
-    test_health()
-
-    # CRUD operations
-    created_ids = test_create_items()
-    test_list_items()
-
-    if created_ids:
-        test_get_item(created_ids[0])
-        test_update_item(created_ids[0])
-        test_delete_item(created_ids[-1])
-
-    # Test error scenarios
-    test_404()
-    test_slow_endpoint()
-    test_error_endpoint()
+    async with httpx.AsyncClient(
+        base_url=BASE_URL,
+        limits=httpx.Limits(max_connections=100)
+    ) as client:
+        # Check if server is running
+        try:
+            await client.get("/health", timeout=2)
+        except httpx.HTTPError:
+            print_error(f"Cannot connect to {BASE_URL}")
+            print("Make sure the FastAPI server is running:")
+            print("  python main.py")
+            sys.exit(1)
+
+        # Run tests
+        await check_root(client)
+        await check_health(client)
+
+        # CRUD operations
+        created_ids = await check_create_items(client)
+        await check_list_items(client)
+
+        if created_ids:
+            await check_get_item(client, created_ids[0])
+            await check_update_item(client, created_ids[0])
+            await check_delete_item(client, created_ids[-1])
+
+        # Test error scenarios
+        await check_404(client)
+        await check_slow_endpoint(client)
+        await check_error_endpoint(client)
 
     print(f"\n{Colors.YELLOW}{'=' * 60}")
     print("Testing Complete!")
     print(f"{'=' * 60}{Colors.END}")
     print("\nMetrics should now be visible in your OTel collector/backend")
     print("Check the following metrics:")
-    print("  - http.server.duration (automatic)")
-    print("  - http.server.request.count (automatic)")
     print("  - custom.requests.total")
     print("  - custom.processing.duration")
     print("  - custom.active.connections")
+    print("  - custom.simulated.delay")
 
 
 if __name__ == "__main__":
-    run_all_tests()
\ No newline at end of file
+    asyncio.run(run_all_tests())
\ No newline at end of file
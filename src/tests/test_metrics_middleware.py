@@ -0,0 +1,102 @@
+"""
+Regression tests for MetricsMiddleware
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+class Recorder:
+    """Stand-in for an OTel instrument that logs every call to a shared list"""
+
+    def __init__(self, name, events):
+        self.name = name
+        self.events = events
+
+    def add(self, amount, attributes=None):
+        self.events.append((self.name, amount, attributes))
+
+    record = add
+
+
+@pytest.fixture
+def events(monkeypatch):
+    events = []
+    for name in ("request_counter", "processing_time", "active_connections"):
+        monkeypatch.setattr(main, name, Recorder(name, events))
+    return events
+
+
+def calls(events, name):
+    return [(amount, attrs) for event, amount, attrs in events if event == name]
+
+
+def request_statuses(events):
+    return [attrs for _, attrs in calls(events, "request_counter")]
+
+
+@pytest.mark.parametrize("method, path, route, status", [
+    ("GET", "/", "/", 200),
+    ("GET", "/items/1", "/items/{item_id}", 404),
+    ("PATCH", "/items", "/items", 405),
+])
+def test_status_is_tagged(client, events, method, path, route, status):
+    assert client.request(method, path).status_code == status
+
+    attrs = {"endpoint": route, "method": method, "status": str(status)}
+    assert request_statuses(events) == [attrs]
+    assert [a for _, a in calls(events, "processing_time")] == [attrs]
+
+
+def test_raise_before_response_counts_as_500(redis_server, events):
+    async def boom():
+        raise RuntimeError("boom")
+
+    main.app.add_api_route("/boom", boom)
+    try:
+        with TestClient(main.app, raise_server_exceptions=False) as client:
+            assert client.get("/boom").status_code == 500
+    finally:
+        main.app.router.routes.pop()
+        main.ROUTE_ATTRS.pop("/boom", None)
+
+    assert request_statuses(events) == [{"endpoint": "/boom", "method": "GET", "status": "500"}]
+    assert [amount for amount, _ in calls(events, "active_connections")] == [1, -1]
+
+
+def test_unknown_paths_share_one_bucket(client, events):
+    client.get("/nope")
+    client.get("/also/nope")
+
+    unmatched = {"endpoint": "unmatched", "method": "GET", "status": "404"}
+    assert request_statuses(events) == [unmatched, unmatched]
+    assert {a["endpoint"] for _, a in calls(events, "active_connections")} == {"unmatched"}
+
+
+def test_health_is_unmetered(client, events):
+    assert client.get("/health").status_code == 200
+
+    assert events == []
+
+
+def test_connection_gauge_uses_shared_route_attrs(client, events):
+    client.get("/items/1")
+
+    (up, up_attrs), (down, down_attrs) = calls(events, "active_connections")
+    assert (up, down) == (1, -1)
+    assert up_attrs is down_attrs is main.ROUTE_ATTRS["/items/{item_id}"]
+
+
+def test_closes_out_before_background_task(client, events, monkeypatch):
+    async def record_slow(delay):
+        events.append(("background", delay, None))
+
+    monkeypatch.setattr(main, "record_slow", record_slow)
+
+    assert client.get("/simulate/slow").status_code == 200
+
+    assert [event for event, _, _ in events] == [
+        "active_connections", "request_counter", "processing_time", "active_connections", "background"
+    ]
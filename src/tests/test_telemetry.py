@@ -0,0 +1,149 @@
+"""
+Unit tests for the batched OTLP export in telemetry.py
+"""
+
+import importlib
+import math
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import (
+    ConsoleMetricExporter,
+    InMemoryMetricReader,
+    MetricExporter,
+    MetricExportResult,
+)
+
+import telemetry
+from telemetry import BatchingMetricReader, split_metrics_data
+
+
+def collect(points_per_scope: dict[str, dict[str, int]]):
+    """Record the given number of distinct data points per (scope, metric)"""
+    reader = InMemoryMetricReader()
+    provider = MeterProvider(metric_readers=[reader])
+    for scope, metrics in points_per_scope.items():
+        meter = provider.get_meter(scope)
+        for name, count in metrics.items():
+            counter = meter.create_counter(name)
+            for i in range(count):
+                counter.add(1, {"i": i})
+    data = reader.get_metrics_data()
+    provider.shutdown()
+    return data
+
+
+class RecordingExporter(MetricExporter):
+    """Records (data points, timeout) for every export call"""
+
+    def __init__(self):
+        super().__init__()
+        self.exports = []
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        self.exports.append((len(data_point_keys(metrics_data)), timeout_millis))
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return True
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        pass
+
+
+def record_with_reader(reader, count):
+    """Register reader on a fresh provider and record count distinct data points"""
+    provider = MeterProvider(metric_readers=[reader])
+    counter = provider.get_meter("scope-a").create_counter("a.one")
+    for i in range(count):
+        counter.add(1, {"i": i})
+    return provider
+
+
+def data_point_keys(metrics_data):
+    return [
+        (scope_metrics.scope.name, metric.name, point.attributes["i"])
+        for resource_metrics in metrics_data.resource_metrics
+        for scope_metrics in resource_metrics.scope_metrics
+        for metric in scope_metrics.metrics
+        for point in metric.data.data_points
+    ]
+
+
+def test_split_across_metric_and_scope_boundaries():
+    data = collect({"scope-a": {"a.one": 3, "a.two": 4}, "scope-b": {"b.one": 5}})
+
+    batches = list(split_metrics_data(data, 5))
+
+    assert [len(data_point_keys(batch)) for batch in batches] == [5, 5, 2]
+    split_keys = [key for batch in batches for key in data_point_keys(batch)]
+    assert sorted(split_keys) == sorted(data_point_keys(data))
+    assert len(set(split_keys)) == len(split_keys)
+
+
+def test_split_exact_multiple_has_no_empty_trailing_batch():
+    data = collect({"scope-a": {"a.one": 10}})
+
+    batches = list(split_metrics_data(data, 5))
+
+    assert [len(data_point_keys(batch)) for batch in batches] == [5, 5]
+
+
+def test_split_keeps_resource_and_scope():
+    data = collect({"scope-a": {"a.one": 2}})
+
+    (batch,) = split_metrics_data(data, 512)
+
+    assert batch.resource_metrics[0].resource == data.resource_metrics[0].resource
+    assert batch.resource_metrics[0].scope_metrics[0].scope.name == "scope-a"
+
+
+@pytest.mark.parametrize("size", [0, -1])
+def test_split_rejects_non_positive_batch_size(size):
+    with pytest.raises(ValueError):
+        list(split_metrics_data(collect({"scope-a": {"a.one": 1}}), size))
+
+
+@pytest.mark.parametrize("size", [0, -1])
+def test_reader_rejects_non_positive_batch_size(size):
+    with pytest.raises(ValueError):
+        BatchingMetricReader(ConsoleMetricExporter(), max_export_batch_size=size)
+
+
+def test_reader_exports_each_batch_with_its_own_timeout():
+    exporter = RecordingExporter()
+    # No background ticker, collection is driven by the test
+    reader = BatchingMetricReader(exporter, max_export_batch_size=4, export_interval_millis=math.inf)
+    provider = record_with_reader(reader, 10)
+
+    reader.collect(timeout_millis=1_500)
+
+    assert exporter.exports == [(4, 1_500), (4, 1_500), (2, 1_500)]
+    provider.shutdown()
+
+
+def test_reader_logs_split_errors(monkeypatch, caplog):
+    def broken_split(metrics_data, max_batch_size):
+        raise RuntimeError("split failed")
+        yield
+
+    monkeypatch.setattr(telemetry, "split_metrics_data", broken_split)
+    exporter = RecordingExporter()
+    reader = BatchingMetricReader(exporter, export_interval_millis=math.inf)
+    provider = record_with_reader(reader, 1)
+
+    reader.collect()
+
+    assert exporter.exports == []
+    assert "Exception while exporting metrics" in caplog.text
+    provider.shutdown()
+
+
+def test_env_batch_size_must_be_positive(monkeypatch):
+    monkeypatch.setenv("OTEL_METRIC_EXPORT_MAX_BATCH_SIZE", "0")
+    try:
+        with pytest.raises(ValueError):
+            importlib.reload(telemetry)
+    finally:
+        monkeypatch.delenv("OTEL_METRIC_EXPORT_MAX_BATCH_SIZE")
+        importlib.reload(telemetry)